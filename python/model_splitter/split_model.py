@@ -10,14 +10,24 @@ Usage:
 """
 
 import argparse
-import json
+import functools
+import gc
+import multiprocessing
+import os
+import re
 import shutil
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
+import orjson
 import torch
-from safetensors.torch import save_file
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from huggingface_hub import snapshot_download
+from safetensors import safe_open
+from transformers import AutoConfig, AutoTokenizer
 
 
 def parse_args():
@@ -53,31 +63,145 @@ def parse_args():
         default=None,
         help="Where to save tokenizer (defaults to output directory)",
     )
+    parser.add_argument(
+        "--disable-mmap",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Read weights with plain sequential reads instead of mmap "
+        "(defaults to on for NFS/FUSE/CIFS mounts)",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=1,
+        help="Number of processes splitting partitions concurrently. Each worker "
+        "holds a whole partition (plus its quantized copy) in memory, so N workers "
+        "means N resident partitions; 1 uses an in-process pipeline that keeps at "
+        "most two partitions resident",
+    )
     return parser.parse_args()
 
 
-def get_layer_groups(model, num_partitions: int) -> List[Tuple[int, int]]:
+# Safetensors dtype names -> torch dtypes
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+# Matches the layer index in names like "model.layers.3.mlp.up_proj.weight"
+# and "transformer.h.3.attn.c_attn.weight"
+LAYER_PATTERN = re.compile(r"\.(?:layers|h)\.(\d+)\.")
+
+# Attribute the causal-LM class nests the base model under, by model_type
+# (anything not listed uses "model")
+BASE_MODEL_PREFIXES = {
+    "gpt2": "transformer",
+    "gpt_neo": "transformer",
+    "gptj": "transformer",
+    "gpt_neox": "gpt_neox",
+}
+
+
+def resolve_model_dir(model: str) -> Path:
+    """
+    Resolve a model name or path to a local directory of Safetensors shards.
+
+    For hub models the JSON files are downloaded first, then only the shards
+    named in the Safetensors index (or the single model.safetensors file), so
+    duplicate exports such as consolidated.safetensors are never fetched.
+    """
+    if Path(model).is_dir():
+        return Path(model)
+
+    model_dir = Path(snapshot_download(model, allow_patterns=["*.json"]))
+
+    index_path = model_dir / "model.safetensors.index.json"
+    if index_path.exists():
+        with open(index_path, "rb") as f:
+            shards = sorted(set(orjson.loads(f.read())["weight_map"].values()))
+    else:
+        shards = ["model.safetensors"]
+
+    return Path(snapshot_download(model, allow_patterns=shards))
+
+
+def is_network_filesystem(path: Path) -> bool:
+    """Check whether a path lives on a network or FUSE mount."""
+    try:
+        with open("/proc/mounts") as f:
+            mounts = [line.split() for line in f]
+    except OSError:
+        return False
+
+    # The longest mount point containing the path is the one it lives on
+    resolved = str(path.resolve())
+    best_mount, best_fstype = "", ""
+    for fields in mounts:
+        if len(fields) < 3:
+            continue
+        mount_point, fstype = fields[1], fields[2]
+        contains = resolved == mount_point or resolved.startswith(mount_point.rstrip("/") + "/")
+        if contains and len(mount_point) > len(best_mount):
+            best_mount, best_fstype = mount_point, fstype
+
+    return best_fstype.startswith(("nfs", "fuse", "cifs", "smb"))
+
+
+def get_weight_map(model_dir: Path) -> Dict[str, str]:
+    """
+    Map every weight name to the shard file that contains it.
+
+    Args:
+        model_dir: Local model directory
+
+    Returns:
+        Dict of weight name -> shard file name
+    """
+    index_path = model_dir / "model.safetensors.index.json"
+    if index_path.exists():
+        with open(index_path, "rb") as f:
+            return orjson.loads(f.read())["weight_map"]
+
+    # Unsharded checkpoint: only the header is read to list the tensors
+    single_path = model_dir / "model.safetensors"
+    if single_path.exists():
+        with safe_open(str(single_path), framework="pt", device="cpu") as f:
+            return {name: single_path.name for name in f.keys()}
+
+    raise ValueError(f"No Safetensors weights found in {model_dir}")
+
+
+def get_layer_groups(
+    config,
+    num_partitions: int,
+    verbose: bool = False,
+) -> List[Tuple[int, int]]:
     """
     Calculate layer group boundaries.
 
     Args:
-        model: The model to split
+        config: The model config
         num_partitions: Number of partitions to create
+        verbose: Print the layer count and resulting groups
 
     Returns:
         List of (start_layer, end_layer) tuples
     """
     # Try to determine number of layers
-    if hasattr(model, "model") and hasattr(model.model, "layers"):
-        num_layers = len(model.model.layers)
-    elif hasattr(model, "transformer") and hasattr(model.transformer, "h"):
-        num_layers = len(model.transformer.h)
-    elif hasattr(model, "gpt_neox") and hasattr(model.gpt_neox, "layers"):
-        num_layers = len(model.gpt_neox.layers)
-    else:
+    num_layers = getattr(config, "num_hidden_layers", None)
+    if num_layers is None:
         raise ValueError("Cannot determine model architecture")
 
-    print(f"Model has {num_layers} layers")
+    if verbose:
+        print(f"Model has {num_layers} layers")
 
     # Calculate layer groups
     layers_per_partition = (num_layers + num_partitions - 1) // num_partitions
@@ -89,164 +213,744 @@ def get_layer_groups(model, num_partitions: int) -> List[Tuple[int, int]]:
         if start < num_layers:
             layer_groups.append((start, end))
 
-    print(f"Created {len(layer_groups)} layer groups:")
-    for i, (start, end) in enumerate(layer_groups):
-        print(f"  Partition {i}: layers {start}-{end}")
+    if verbose:
+        print(f"Created {len(layer_groups)} layer groups:")
+        for i, (start, end) in enumerate(layer_groups):
+            print(f"  Partition {i}: layers {start}-{end}")
 
     return layer_groups
 
 
-def get_layer_prefix(layer_idx: int, model) -> str:
-    """Get the prefix for layer weights based on model architecture."""
-    if hasattr(model, "model") and hasattr(model.model, "layers"):
-        return f"model.layers.{layer_idx}"
-    elif hasattr(model, "transformer") and hasattr(model.transformer, "h"):
-        return f"transformer.h.{layer_idx}"
-    elif hasattr(model, "gpt_neox") and hasattr(model.gpt_neox, "layers"):
-        return f"gpt_neox.layers.{layer_idx}"
+def get_source_names(weight_map: Dict[str, str], config) -> Dict[str, str]:
+    """
+    Map the weight names from_pretrained would use to the names in the shards.
+
+    Checkpoints saved from a bare base model (e.g. GPT2Model) store names like
+    "h.0.attn.c_attn.weight" without the "transformer." prefix the causal-LM
+    class adds; the prefix is restored so output names match a loaded model.
+
+    Args:
+        weight_map: Weight name -> shard file map for the full model
+        config: The model config
+
+    Returns:
+        Dict of model weight name -> shard weight name
+    """
+    prefix = BASE_MODEL_PREFIXES.get(getattr(config, "model_type", None), "model") + "."
+
+    if any(name.startswith(prefix) for name in weight_map):
+        return {name: name for name in weight_map}
+
+    return {prefix + name: name for name in weight_map}
+
+
+def detect_arch(source_names: Dict[str, str], config) -> Dict[str, Optional[str]]:
+    """
+    Detect the model architecture family once from its weight names.
+
+    Args:
+        source_names: Model weight name -> shard weight name, from get_source_names
+        config: The model config
+
+    Returns:
+        Dict with the model names of the embedding ("embed_key"), LM head
+        ("head_key") and final norm ("norm_key") weights; None when absent
+    """
+    if "model.embed_tokens.weight" in source_names:
+        embed_key, norm_key = "model.embed_tokens.weight", "model.norm.weight"
+    elif "transformer.wte.weight" in source_names:
+        embed_key, norm_key = "transformer.wte.weight", None
+    elif "gpt_neox.embed_in.weight" in source_names:
+        embed_key, norm_key = "gpt_neox.embed_in.weight", None
     else:
         raise ValueError("Unknown model architecture")
 
+    if "lm_head.weight" in source_names:
+        head_key = "lm_head.weight"
+    elif getattr(config, "tie_word_embeddings", False):
+        # Tied heads are not stored separately; reuse the input embedding
+        head_key = embed_key
+    else:
+        head_key = None
 
-def get_embeddings(model) -> Dict[str, torch.Tensor]:
-    """Extract embedding layers."""
-    embeddings = {}
+    return {
+        "embed_key": embed_key,
+        "head_key": head_key,
+        "norm_key": norm_key if norm_key in source_names else None,
+    }
 
-    if hasattr(model, "model") and hasattr(model.model, "embed_tokens"):
-        embeddings["model.embed_tokens.weight"] = model.model.embed_tokens.weight.data
-    elif hasattr(model, "transformer") and hasattr(model.transformer, "wte"):
-        embeddings["transformer.wte.weight"] = model.transformer.wte.weight.data
-    elif hasattr(model, "gpt_neox") and hasattr(model.gpt_neox, "embed_in"):
-        embeddings["gpt_neox.embed_in.weight"] = model.gpt_neox.embed_in.weight.data
 
-    return embeddings
+def get_embeddings(arch: Dict[str, Optional[str]]) -> Dict[str, str]:
+    """Locate embedding layers."""
+    return {arch["embed_key"]: arch["embed_key"]}
 
 
-def get_lm_head(model) -> Dict[str, torch.Tensor]:
-    """Extract language model head."""
-    lm_head = {}
+def get_lm_head(arch: Dict[str, Optional[str]]) -> Dict[str, str]:
+    """Locate language model head."""
+    return {"lm_head.weight": arch["head_key"]} if arch["head_key"] else {}
 
-    if hasattr(model, "lm_head"):
-        lm_head["lm_head.weight"] = model.lm_head.weight.data
 
-    return lm_head
+def get_norm_layers(arch: Dict[str, Optional[str]]) -> Dict[str, str]:
+    """Locate normalization layers."""
+    return {arch["norm_key"]: arch["norm_key"]} if arch["norm_key"] else {}
 
 
-def get_norm_layers(model) -> Dict[str, torch.Tensor]:
-    """Extract normalization layers."""
-    norms = {}
+def assign_partitions(
+    source_names: Dict[str, str],
+    arch: Dict[str, Optional[str]],
+    layer_groups: List[Tuple[int, int]],
+) -> List[Dict[str, str]]:
+    """
+    Assign every weight to its partition in a single pass over the weight names.
 
-    if hasattr(model, "model") and hasattr(model.model, "norm"):
-        norms["model.norm.weight"] = model.model.norm.weight.data
+    Args:
+        source_names: Model weight name -> shard weight name, from get_source_names
+        arch: Architecture info, from detect_arch
+        layer_groups: List of layer group tuples
 
-    return norms
+    Returns:
+        One dict of output weight name -> source weight name per partition
+    """
+    layer_to_partition = {}
+    for partition_idx, (start_layer, end_layer) in enumerate(layer_groups):
+        for layer_idx in range(start_layer, end_layer):
+            layer_to_partition[layer_idx] = partition_idx
 
+    partitions = [{} for _ in layer_groups]
 
-def split_partition(
-    state_dict: Dict[str, torch.Tensor],
-    layer_group: Tuple[int, int],
-    partition_idx: int,
-    model,
+    # Extract layer weights
+    for name, source in source_names.items():
+        match = LAYER_PATTERN.search(name)
+        if match:
+            partition_idx = layer_to_partition.get(int(match.group(1)))
+            if partition_idx is not None:
+                partitions[partition_idx][name] = source
+
+    # First partition gets embeddings
+    embeddings = get_embeddings(arch)
+    partitions[0].update({name: source_names[key] for name, key in embeddings.items()})
+
+    # Last partition gets LM head and final norm
+    final_layers = {**get_lm_head(arch), **get_norm_layers(arch)}
+    partitions[-1].update({name: source_names[key] for name, key in final_layers.items()})
+
+    return partitions
+
+
+def read_tensors_direct(path: Path, names: List[str]) -> Dict[str, torch.Tensor]:
+    """
+    Read tensors from a Safetensors file without memory-mapping it.
+
+    Each tensor is read straight into a preallocated buffer in offset order, so
+    network and FUSE mounts see large sequential reads instead of one page
+    fault per 4KB page.
+
+    Args:
+        path: Safetensors file path
+        names: Names of the tensors to read
+
+    Returns:
+        Dict of tensor name -> tensor
+    """
+    tensors = {}
+
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+        # 8-byte little-endian header length, then the JSON header
+        header_len = int.from_bytes(f.read(8), "little")
+        header = orjson.loads(f.read(header_len))
+        data_start = 8 + header_len
+
+        for name in sorted(names, key=lambda n: header[n]["data_offsets"][0]):
+            info = header[name]
+            begin, end = info["data_offsets"]
+
+            buffer = torch.empty(end - begin, dtype=torch.uint8)
+            view = memoryview(buffer.numpy())
+            f.seek(data_start + begin)
+            read = 0
+            while read < len(view):
+                n = f.readinto(view[read:])
+                if not n:
+                    raise EOFError(f"Unexpected end of file reading {name} from {path}")
+                read += n
+
+            tensors[name] = buffer.view(SAFETENSORS_DTYPES[info["dtype"]]).reshape(info["shape"])
+
+    return tensors
+
+
+def load_partition(
+    model_dir: Path,
+    weight_map: Dict[str, str],
+    partition_names: Dict[str, str],
+    use_mmap: bool = True,
 ) -> Dict[str, torch.Tensor]:
     """
-    Extract a single layer partition from the full state dict.
+    Read a partition's tensors from the source shards.
+
+    Each shard is opened lazily and only the requested tensors are read, so the
+    full model is never resident in memory. Float tensors are cast to FP16.
 
     Args:
-        state_dict: Full model state dict
-        layer_group: (start_layer, end_layer) tuple
-        partition_idx: Index of this partition
-        model: The model (for architecture detection)
+        model_dir: Local model directory
+        weight_map: Weight name -> shard file map for the full model
+        partition_names: Output weight name -> source weight name
+        use_mmap: Memory-map shards via safe_open; otherwise use direct reads
 
     Returns:
         State dict containing only this partition's weights
     """
+    names_by_shard = defaultdict(list)
+    for name, source in partition_names.items():
+        names_by_shard[weight_map[source]].append((name, source))
+
     partition_state = {}
-    start_layer, end_layer = layer_group
+    for shard, names in names_by_shard.items():
+        sources = list({source for _, source in names})
+        if use_mmap:
+            with safe_open(str(model_dir / shard), framework="pt", device="cpu") as f:
+                tensors = {source: f.get_tensor(source) for source in sources}
+        else:
+            tensors = read_tensors_direct(model_dir / shard, sources)
+
+        for name, source in names:
+            tensor = tensors[source]
+            if tensor.is_floating_point():
+                tensor = tensor.to(torch.float16)
+            partition_state[name] = tensor
 
-    # Extract layer weights
-    for layer_idx in range(start_layer, end_layer):
-        prefix = get_layer_prefix(layer_idx, model)
+    return partition_state
 
-        for key, value in state_dict.items():
-            if key.startswith(prefix):
-                partition_state[key] = value
 
-    # First partition gets embeddings
-    if partition_idx == 0:
-        partition_state.update(get_embeddings(model))
+def quantize_kernel(t: torch.Tensor, scale: torch.Tensor, qmin: int, qmax: int) -> torch.Tensor:
+    """Scale, round and clamp a tensor onto the signed integer grid [qmin, qmax]."""
+    return t.div(scale).round_().clamp_(qmin, qmax).to(torch.int8)
 
-    # Last partition gets LM head and final norm
-    if partition_idx == len(get_layer_groups(model, (end_layer - start_layer))) - 1:
-        partition_state.update(get_lm_head(model))
-        partition_state.update(get_norm_layers(model))
 
-    return partition_state
+# Kernel used for CUDA tensors; built on first use by get_quantize_kernel
+cuda_quantize_kernel = None
+
+
+def get_quantize_kernel(t: torch.Tensor) -> Callable[..., torch.Tensor]:
+    """
+    Pick the quantization kernel for a tensor.
+
+    On CUDA the elementwise chain is compiled into a single fused Triton kernel,
+    so each weight passes through memory once; dynamic shapes let one compiled
+    kernel serve every tensor size. Compilation is deferred until a CUDA tensor
+    arrives and skipped where torch.compile is unsupported or Triton is missing
+    (Windows), falling back to the eager kernel.
+    """
+    global cuda_quantize_kernel
+
+    if not t.is_cuda:
+        return quantize_kernel
+
+    if cuda_quantize_kernel is None:
+        import torch._dynamo
+
+        if sys.platform != "win32" and torch._dynamo.is_dynamo_supported():
+            cuda_quantize_kernel = torch.compile(quantize_kernel, fullgraph=True, dynamic=True)
+        else:
+            cuda_quantize_kernel = quantize_kernel
+
+    return cuda_quantize_kernel
+
+
+def symmetric_scale(
+    tensor: torch.Tensor,
+    qmax: int,
+    device: Optional[str] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Move a tensor to the quantization device and compute its symmetric scale.
+
+    2-D weights get one scale per output channel (row); other tensors get a
+    single per-tensor scale.
+
+    Args:
+        tensor: Input tensor
+        qmax: Largest value of the signed integer grid (127 for INT8, 7 for INT4)
+        device: Device to quantize on (defaults to CUDA when available)
+
+    Returns:
+        (tensor, scale) on the quantization device, where scale broadcasts
+        against the tensor
+    """
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    # Weights from load_partition are already FP16, so this only casts FP32
+    # tensors passed in directly
+    t = tensor.to(device, dtype=torch.float16, non_blocking=True)
+
+    # Calculate scale from the absolute maximum in FP32, so rows with small
+    # weights keep full resolution; guard all-zero rows
+    if t.dim() == 2:
+        absmax = t.abs().amax(dim=1, keepdim=True)
+    else:
+        absmax = t.abs().amax().reshape([1] * t.dim())
+    scale = (absmax.float() / qmax).clamp_min(torch.finfo(torch.float32).tiny)
+
+    return t, scale
+
+
+@torch.inference_mode()
+def quantize_int8(
+    tensor: torch.Tensor,
+    device: Optional[str] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Quantize a tensor to symmetric INT8.
+
+    Uses a scale-only scheme with no zero-point, so a quantized matmul
+    reduces to an integer GEMM followed by a single scale multiply. 2-D
+    weights get one scale per output channel (row); other tensors get a
+    single per-tensor scale.
+
+    Args:
+        tensor: Input tensor
+        device: Device to quantize on (defaults to CUDA when available)
 
+    Returns:
+        (quantized_tensor, scale) on the input's device, where scale
+        broadcasts against the input
+    """
+    t, scale = symmetric_scale(tensor, 127, device)
+
+    # Quantize, reusing the intermediate buffer for every step after the division
+    quantized = get_quantize_kernel(t)(t, scale, -128, 127)
+
+    return quantized.to(tensor.device), scale.to(tensor.device)
 
-def quantize_int8(tensor: torch.Tensor) -> Tuple[torch.Tensor, float]:
+
+@torch.inference_mode()
+def quantize_int4(
+    tensor: torch.Tensor,
+    device: Optional[str] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
     """
-    Quantize a tensor to INT8.
+    Quantize a tensor to symmetric INT4, packing two values per byte.
+
+    Scales are chosen by symmetric_scale. Values are packed along the last
+    dimension, low nibble first; an odd last dimension is padded with a zero,
+    so the original shape is needed to unpack.
 
     Args:
         tensor: Input tensor
+        device: Device to quantize on (defaults to CUDA when available)
+
+    Returns:
+        (packed_tensor, scale) on the input's device, where packed_tensor is
+        uint8 with the last dimension halved (rounded up)
+    """
+    t, scale = symmetric_scale(tensor, 7, device)
+
+    # Quantize to [-8, 7], then reinterpret as two's-complement nibbles
+    quantized = get_quantize_kernel(t)(t, scale, -8, 7).reshape(t.shape or (1,))
+    if quantized.shape[-1] % 2:
+        quantized = torch.nn.functional.pad(quantized, (0, 1))
+    nibbles = torch.bitwise_and(quantized.view(torch.uint8), 0x0F)
+    nibbles = nibbles.reshape(*nibbles.shape[:-1], -1, 2)
+
+    packed = torch.bitwise_or(nibbles[..., 0], torch.bitwise_left_shift(nibbles[..., 1], 4))
+
+    return packed.to(tensor.device), scale.to(tensor.device)
+
+
+@torch.inference_mode()
+def quantize_tensors_cuda(
+    tensors: List[torch.Tensor],
+    quantize_fn: Callable[..., Tuple[torch.Tensor, torch.Tensor]],
+) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    """
+    Quantize CPU tensors on the GPU, overlapping transfers with compute.
+
+    Uploads and downloads run on their own CUDA streams, so the host-to-device
+    copy of tensor N+1 and the device-to-host copy of tensor N-1 overlap with
+    quantizing tensor N. Each direction reuses a single pinned staging buffer
+    sized for the largest tensor, so page-locked memory stays bounded; results
+    are copied out of it into ordinary pageable memory.
+
+    Args:
+        tensors: CPU tensors to quantize
+        quantize_fn: quantize_int8 or quantize_int4
 
     Returns:
-        (quantized_tensor, scale)
+        List of (quantized_tensor, scale) pairs in CPU memory
+    """
+    compute_stream = torch.cuda.current_stream()
+    upload_stream = torch.cuda.Stream()
+    download_stream = torch.cuda.Stream()
+
+    def padded_nbytes(tensor: torch.Tensor) -> int:
+        # Keep every staged tensor 8-byte aligned so it can be viewed as any dtype
+        return (tensor.numel() * tensor.element_size() + 7) // 8 * 8
+
+    def stage(buffer: torch.Tensor, tensor: torch.Tensor, offset: int = 0) -> torch.Tensor:
+        nbytes = tensor.numel() * tensor.element_size()
+        return buffer[offset:offset + nbytes].view(tensor.dtype).view(tensor.shape)
+
+    def max_output_nbytes(tensor: torch.Tensor) -> int:
+        # At most one byte per element for the values, plus one FP32 scale per row
+        rows = tensor.shape[0] if tensor.dim() == 2 else 1
+        return (tensor.numel() + 7) // 8 * 8 + (4 * rows + 7) // 8 * 8
+
+    upload_buffer = torch.empty(
+        max((padded_nbytes(t) for t in tensors), default=0),
+        dtype=torch.uint8,
+        pin_memory=True,
+    )
+    download_buffer = torch.empty(
+        max((max_output_nbytes(t) for t in tensors), default=0),
+        dtype=torch.uint8,
+        pin_memory=True,
+    )
+    upload_done = torch.cuda.Event()
+    download_done = torch.cuda.Event()
+
+    results = []
+    in_flight = None
+
+    def upload(tensor: torch.Tensor) -> torch.Tensor:
+        # The previous upload must have left the staging buffer before it is reused
+        upload_done.synchronize()
+        staged = stage(upload_buffer, tensor)
+        staged.copy_(tensor)
+        with torch.cuda.stream(upload_stream):
+            device_tensor = staged.to("cuda", non_blocking=True)
+            upload_done.record()
+        compute_stream.wait_stream(upload_stream)
+        device_tensor.record_stream(compute_stream)
+        return device_tensor
+
+    def collect():
+        # Copy the last download out of the staging buffer into pageable memory
+        nonlocal in_flight
+        if in_flight is not None:
+            download_done.synchronize()
+            results.append(tuple(torch.empty(t.shape, dtype=t.dtype).copy_(t) for t in in_flight))
+            in_flight = None
+
+    def download(outputs: Tuple[torch.Tensor, torch.Tensor]):
+        nonlocal download_buffer, in_flight
+        collect()
+
+        nbytes = sum(padded_nbytes(t) for t in outputs)
+        if download_buffer.numel() < nbytes:
+            download_buffer = torch.empty(nbytes, dtype=torch.uint8, pin_memory=True)
+
+        staged = []
+        offset = 0
+        for tensor in outputs:
+            staged.append(stage(download_buffer, tensor, offset))
+            offset += padded_nbytes(tensor)
+
+        download_stream.wait_stream(compute_stream)
+        with torch.cuda.stream(download_stream):
+            for host_tensor, device_tensor in zip(staged, outputs):
+                host_tensor.copy_(device_tensor, non_blocking=True)
+                device_tensor.record_stream(download_stream)
+            download_done.record()
+        in_flight = staged
+
+    next_tensor = upload(tensors[0]) if tensors else None
+
+    for i in range(len(tensors)):
+        outputs = quantize_fn(next_tensor, device="cuda")
+
+        # Stage the next upload on the host while the GPU quantizes this tensor
+        if i + 1 < len(tensors):
+            next_tensor = upload(tensors[i + 1])
+
+        download(outputs)
+
+    collect()
+
+    return results
+
+
+def save_file_zerocopy(
+    tensors: Dict[str, torch.Tensor],
+    path: Path,
+    metadata: Optional[Dict[str, str]] = None,
+) -> int:
     """
-    # Find min and max
-    min_val = tensor.min().item()
-    max_val = tensor.max().item()
+    Write tensors to a Safetensors file straight from their storage.
 
-    # Calculate scale
-    scale = (max_val - min_val) / 255.0
+    Unlike safetensors.torch.save_file, no serialized byte copy of each tensor is
+    built first, so peak memory stays at the size of the tensors themselves.
 
-    # Quantize
-    quantized = torch.round((tensor - min_val) / scale).clamp(0, 255).to(torch.uint8)
+    Args:
+        tensors: Tensors to save
+        path: Output file path
+        metadata: Optional string metadata stored in the header
 
-    return quantized, scale
+    Returns:
+        Number of bytes written
+    """
+    dtype_names = {dtype: name for name, dtype in SAFETENSORS_DTYPES.items()}
+
+    header = {}
+    if metadata:
+        header["__metadata__"] = metadata
+
+    offset = 0
+    for name, tensor in tensors.items():
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {
+            "dtype": dtype_names[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + nbytes],
+        }
+        offset += nbytes
+
+    # Pad the header with spaces so tensor data starts 8-byte aligned
+    header_bytes = orjson.dumps(header)
+    header_bytes += b" " * (-len(header_bytes) % 8)
+
+    def buffers() -> Iterator[memoryview]:
+        yield memoryview(len(header_bytes).to_bytes(8, "little"))
+        yield memoryview(header_bytes)
+        for tensor in tensors.values():
+            if tensor.numel() > 0:
+                data = tensor.detach().contiguous().reshape(-1).view(torch.uint8)
+                yield memoryview(data.numpy())
+
+    with open(path, "wb", buffering=0) as f:
+        for view in buffers():
+            view = view.cast("B")
+            while view:
+                view = view[f.write(view):]
+
+    return 8 + len(header_bytes) + offset
+
+
+def quantize_partition(
+    partition_state: Dict[str, torch.Tensor],
+    quantization: str,
+    max_workers: Optional[int] = None,
+) -> Dict[str, torch.Tensor]:
+    """
+    Quantize a partition's float tensors.
+
+    Args:
+        partition_state: Partition state dict
+        quantization: Quantization type ("none", "int8", "int4")
+        max_workers: Threads used for CPU quantization (defaults to the CPU count)
+
+    Returns:
+        State dict ready to be saved
+    """
+    if quantization == "int8":
+        quantize_fn = quantize_int8
+    elif quantization == "int4":
+        quantize_fn = quantize_int4
+    else:
+        return partition_state
+
+    # Quantize all float tensors; scales are stored alongside as FP32 tensors
+    float_items = [
+        (key, value)
+        for key, value in partition_state.items()
+        if value.dtype in (torch.float16, torch.float32)
+    ]
+
+    if torch.cuda.is_available():
+        results = quantize_tensors_cuda([value for _, value in float_items], quantize_fn)
+    else:
+        # Torch releases the GIL inside tensor ops, so tensors are quantized
+        # concurrently; intra-op threading is disabled meanwhile to avoid
+        # oversubscribing the cores
+        num_threads = torch.get_num_threads()
+        torch.set_num_threads(1)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+                results = list(executor.map(quantize_fn, (value for _, value in float_items)))
+        finally:
+            torch.set_num_threads(num_threads)
+
+    quantized_state = dict(partition_state)
+    for (key, value), (quantized, scale) in zip(float_items, results):
+        quantized_state[key] = quantized
+        quantized_state[key + ".scale"] = scale.reshape(-1).to(torch.float32)
+        if quantization == "int4":
+            # Packed tensors lose their original shape
+            quantized_state[key + ".shape"] = torch.tensor(value.shape, dtype=torch.int64)
+
+    return quantized_state
 
 
 def save_partition(
     partition_state: Dict[str, torch.Tensor],
     output_path: Path,
     quantization: str,
-):
+) -> int:
     """
     Save a partition to Safetensors format.
 
     Args:
-        partition_state: Partition state dict
+        partition_state: Partition state dict, already quantized
         output_path: Output file path
         quantization: Quantization type ("none", "int8", "int4")
+
+    Returns:
+        Number of bytes written
     """
-    if quantization == "int8":
-        # Quantize all float tensors
-        quantized_state = {}
-        scales = {}
-
-        for key, value in partition_state.items():
-            if value.dtype == torch.float16 or value.dtype == torch.float32:
-                quantized, scale = quantize_int8(value)
-                quantized_state[key] = quantized
-                scales[key] = scale
-            else:
-                quantized_state[key] = value
-
-        # Save quantized tensors
-        save_file(quantized_state, output_path)
-
-        # Save quantization metadata
-        metadata_path = output_path.with_suffix(".json")
-        with open(metadata_path, "w") as f:
-            json.dump({"scales": scales, "quantization": "int8"}, f, indent=2)
+    # Quantization scheme is recorded in the header; scales are tensors in the file.
+    # "symmetric" scales are per row for 2-D weights and per tensor otherwise,
+    # as read from the shape of each <name>.scale tensor
+    metadata = None
+    if quantization != "none":
+        metadata = {"qscheme": "symmetric", "qdtype": quantization}
 
-    else:
-        # Save without quantization
-        save_file(partition_state, output_path)
+    return save_file_zerocopy(partition_state, output_path, metadata=metadata)
+
+
+def save_and_report(
+    partition_state: Dict[str, torch.Tensor],
+    partition_idx: int,
+    output_path: Path,
+    quantization: str,
+) -> Tuple[int, float]:
+    """
+    Save a quantized partition, release its tensors and report its size.
+
+    Args:
+        partition_state: Partition state dict, already quantized
+        partition_idx: Index of the partition
+        output_path: Output file path
+        quantization: Quantization type ("none", "int8", "int4")
+
+    Returns:
+        (bytes_written, save_seconds)
+    """
+    t_start = time.perf_counter()
+    nbytes = save_partition(partition_state, output_path, quantization)
+    elapsed = time.perf_counter() - t_start
+
+    # Drop this partition's tensors before the next one is handed over;
+    # the dict may share tensors with the unquantized state
+    partition_state.clear()
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+    print(f"  Saved partition {partition_idx} to {output_path}")
+    print(f"  Partition size: {nbytes / (1024**3):.2f} GB")
+
+    return nbytes, elapsed
+
+
+def split_and_save_partitions(
+    model_dir: Path,
+    weight_map: Dict[str, str],
+    partitions: List[Dict[str, str]],
+    layer_groups: List[Tuple[int, int]],
+    output_dir: Path,
+    quantization: str,
+    use_mmap: bool = True,
+) -> List[Tuple[int, float]]:
+    """
+    Load, quantize and save every partition as a three-stage pipeline.
+
+    While partition N is being quantized, partition N+1 is read from the source
+    shards; partition N is then written out while N+1 finishes loading. The
+    next read only starts once the previous write has finished, so at most two
+    partitions are resident at a time.
+
+    Args:
+        model_dir: Local model directory
+        weight_map: Weight name -> shard file map for the full model
+        partitions: Per-partition weight names, from assign_partitions
+        layer_groups: List of layer group tuples
+        output_dir: Output directory
+        quantization: Quantization type
+        use_mmap: Memory-map shards via safe_open; otherwise use direct reads
+
+    Returns:
+        (bytes_written, save_seconds) for each partition
+    """
+
+    def load(i: int) -> Dict[str, torch.Tensor]:
+        print(f"Processing partition {i}: layers {layer_groups[i][0]}-{layer_groups[i][1]}")
+        return load_partition(model_dir, weight_map, partitions[i], use_mmap=use_mmap)
+
+    save_stats = []
+    with ThreadPoolExecutor(max_workers=1) as loader, ThreadPoolExecutor(max_workers=1) as saver:
+        next_load = loader.submit(load, 0)
+        pending_save = None
+
+        for i in range(len(layer_groups)):
+            partition_state = next_load.result()
+
+            # Wait for the previous write before reading the next partition
+            if pending_save is not None:
+                save_stats.append(pending_save.result())
+            if i + 1 < len(layer_groups):
+                next_load = loader.submit(load, i + 1)
+
+            partition_state = quantize_partition(partition_state, quantization)
+            pending_save = saver.submit(
+                save_and_report,
+                partition_state,
+                i,
+                output_dir / f"partition_{i}.safetensors",
+                quantization,
+            )
+            del partition_state
+
+        if pending_save is not None:
+            save_stats.append(pending_save.result())
+
+    return save_stats
+
+
+def process_and_save_partition(
+    partition_idx: int,
+    layer_group: Tuple[int, int],
+    weight_map: Dict[str, str],
+    partition_names: Dict[str, str],
+    output_path: Path,
+    *,
+    model_dir: Path,
+    quantization: str,
+    use_mmap: bool,
+    num_threads: int,
+) -> Tuple[int, float]:
+    """
+    Load, quantize and save one partition; the unit of work for a process pool.
+
+    Only weight names travel to the worker, which reads its own tensors from
+    the source shards, so no tensor data is pickled between processes. The
+    whole partition is resident in the worker while it is processed.
+
+    Args:
+        partition_idx: Index of the partition
+        layer_group: (start_layer, end_layer) of the partition
+        weight_map: Weight name -> shard file map for this partition's weights
+        partition_names: Output weight name -> source weight name
+        output_path: Output file path
+        model_dir: Local model directory
+        quantization: Quantization type
+        use_mmap: Memory-map shards via safe_open; otherwise use direct reads
+        num_threads: Threads used for CPU quantization
+
+    Returns:
+        (bytes_written, save_seconds)
+    """
+    print(f"Processing partition {partition_idx}: layers {layer_group[0]}-{layer_group[1]}")
+    partition_state = load_partition(model_dir, weight_map, partition_names, use_mmap=use_mmap)
+    partition_state = quantize_partition(partition_state, quantization, max_workers=num_threads)
+
+    return save_and_report(partition_state, partition_idx, output_path, quantization)
 
 
 def generate_partition_metadata(
-    model,
+    config,
     layer_groups: List[Tuple[int, int]],
     output_dir: Path,
     quantization: str,
@@ -255,7 +959,7 @@ def generate_partition_metadata(
     Generate metadata for all partitions.
 
     Args:
-        model: The model
+        config: The model config
         layer_groups: List of layer group tuples
         output_dir: Output directory
         quantization: Quantization type
@@ -264,23 +968,14 @@ def generate_partition_metadata(
         Metadata dictionary
     """
     # Get model config
-    if hasattr(model, "config"):
-        config = model.config
-        hidden_dim = getattr(config, "hidden_size", 4096)
-        num_heads = getattr(config, "num_attention_heads", 32)
-        head_dim = hidden_dim // num_heads
-        intermediate_dim = getattr(config, "intermediate_size", 11008)
-        vocab_size = getattr(config, "vocab_size", 32000)
-    else:
-        # Default values
-        hidden_dim = 4096
-        num_heads = 32
-        head_dim = 128
-        intermediate_dim = 11008
-        vocab_size = 32000
+    hidden_dim = getattr(config, "hidden_size", 4096)
+    num_heads = getattr(config, "num_attention_heads", 32)
+    head_dim = hidden_dim // num_heads
+    intermediate_dim = getattr(config, "intermediate_size", 11008)
+    vocab_size = getattr(config, "vocab_size", 32000)
 
     metadata = {
-        "model_name": model.config._name_or_path if hasattr(model, "config") else "unknown",
+        "model_name": getattr(config, "_name_or_path", "unknown"),
         "num_partitions": len(layer_groups),
         "quantization": quantization,
         "partitions": [],
@@ -306,8 +1001,8 @@ def generate_partition_metadata(
 
     # Save metadata
     metadata_path = output_dir / "partition_metadata.json"
-    with open(metadata_path, "w") as f:
-        json.dump(metadata, f, indent=2)
+    with open(metadata_path, "wb") as f:
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
 
     print(f"Saved partition metadata to {metadata_path}")
 
@@ -326,14 +1021,20 @@ def main():
     output_dir = Path(args.output)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Load model
-    print("Loading model...")
-    model = AutoModelForCausalLM.from_pretrained(
-        args.model,
-        torch_dtype=torch.float16,
-        device_map="cpu",
-        trust_remote_code=True,
-    )
+    # Resolve model weights
+    print("Resolving model weights...")
+    model_dir = resolve_model_dir(args.model)
+    weight_map = get_weight_map(model_dir)
+
+    disable_mmap = args.disable_mmap
+    if disable_mmap is None:
+        disable_mmap = is_network_filesystem(model_dir)
+    if disable_mmap:
+        print("Reading weights without mmap")
+
+    # Load config
+    print("Loading model config...")
+    config = AutoConfig.from_pretrained(args.model, trust_remote_code=True)
 
     # Load tokenizer
     print("Loading tokenizer...")
@@ -344,36 +1045,66 @@ def main():
     tokenizer.save_pretrained(tokenizer_output)
     print(f"Saved tokenizer to {tokenizer_output}")
 
-    # Get state dict
-    print("Extracting state dict...")
-    state_dict = model.state_dict()
-
     # Calculate layer groups
-    layer_groups = get_layer_groups(model, args.num_partitions)
+    layer_groups = get_layer_groups(config, args.num_partitions, verbose=True)
+    source_names = get_source_names(weight_map, config)
+    arch = detect_arch(source_names, config)
+    partitions = assign_partitions(source_names, arch, layer_groups)
+
+    num_workers = min(args.num_workers, len(layer_groups))
 
-    # Split and save partitions
+    # Split and save partitions, streaming each one from the source shards
     print("Splitting model into partitions...")
-    for i, layer_group in enumerate(layer_groups):
-        print(f"Processing partition {i}: layers {layer_group[0]}-{layer_group[1]}")
-
-        # Extract partition
-        partition_state = split_partition(
-            state_dict,
-            layer_group,
-            i,
-            model,
+    t_start = time.perf_counter()
+    if num_workers > 1:
+        # Partitions are independent files, so separate processes write them
+        # concurrently; each gets its share of the CPU threads and holds its
+        # whole partition in memory
+        worker = functools.partial(
+            process_and_save_partition,
+            model_dir=model_dir,
+            quantization=args.quantization,
+            use_mmap=not disable_mmap,
+            num_threads=max(1, (os.cpu_count() or 1) // num_workers),
         )
-
-        # Save partition
-        output_path = output_dir / f"partition_{i}.safetensors"
-        save_partition(partition_state, output_path, args.quantization)
-
-        print(f"  Saved partition {i} to {output_path}")
-        print(f"  Partition size: {output_path.stat().st_size / (1024**3):.2f} GB")
+        jobs = [
+            (
+                i,
+                layer_groups[i],
+                {source: weight_map[source] for source in partition_names.values()},
+                partition_names,
+                output_dir / f"partition_{i}.safetensors",
+            )
+            for i, partition_names in enumerate(partitions)
+        ]
+
+        # Spawned rather than forked, so workers can still initialize CUDA
+        with multiprocessing.get_context("spawn").Pool(processes=num_workers) as pool:
+            save_stats = pool.starmap(worker, jobs, chunksize=1)
+    else:
+        save_stats = split_and_save_partitions(
+            model_dir,
+            weight_map,
+            partitions,
+            layer_groups,
+            output_dir,
+            args.quantization,
+            use_mmap=not disable_mmap,
+        )
+    total_elapsed = time.perf_counter() - t_start
+
+    # Report throughput: overall, and of the write stage alone
+    total_bytes = sum(nbytes for nbytes, _ in save_stats)
+    save_elapsed = sum(elapsed for _, elapsed in save_stats)
+    print(
+        f"Wrote {total_bytes / (1024**3):.2f} GB in {total_elapsed:.1f}s "
+        f"({total_bytes / (1024**2) / max(total_elapsed, 1e-9):.1f} MiB/s overall, "
+        f"{total_bytes / (1024**2) / max(save_elapsed, 1e-9):.1f} MiB/s per writer)"
+    )
 
     # Generate metadata
     print("Generating partition metadata...")
-    metadata = generate_partition_metadata(model, layer_groups, output_dir, args.quantization)
+    metadata = generate_partition_metadata(config, layer_groups, output_dir, args.quantization)
 
     print("\nModel splitting complete!")
     print(f"Output directory: {output_dir}")